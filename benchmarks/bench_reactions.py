@@ -0,0 +1,68 @@
+"""
+Benchmark of the reactions tallies: feed random reaction events to a
+ReactionAggregator and flush it like the main loop does, without calling
+Slack.
+
+Usage, from the directory containing the freespace package:
+
+    python -m freespace.benchmarks.bench_reactions [reactions] [posts]
+"""
+
+import random
+import sys
+import time
+
+from freespace.reactions import ReactionAggregator
+
+
+REACTIONS = ['+1', '-1', 'heart', 'tada', 'eyes']
+FLUSH_DELAY_IN_SECONDS = 2
+# Simulated time between two reactions and between two flushes
+EVENT_INTERVAL_IN_SECONDS = 0.0001
+FLUSH_EVERY = 500
+
+
+def run(count=500000, posts=1000, seed=0):
+    """
+    :param count: Number of reaction events to send.
+    :rtype count: int
+    :param posts: Number of posts the reactions are spread over.
+    :rtype posts: int
+    :param seed: Seed of the random generator, to get comparable runs.
+    :rtype seed: int
+
+    :return: A tuple of the reactions handled per second and the number of
+        updates that would have been sent to Slack.
+    """
+    rng = random.Random(seed)
+    aggregator = ReactionAggregator(FLUSH_DELAY_IN_SECONDS, posts)
+    for ts in range(posts):
+        aggregator.track('C', str(ts), 'post {}'.format(ts))
+
+    # Generate the events beforehand to only time the aggregator
+    events = [(str(rng.randrange(posts)), rng.choice(REACTIONS),
+               1 if rng.random() < 0.8 else -1) for _ in range(count)]
+    updates = []
+
+    def update(**kwargs):
+        updates.append(kwargs)
+
+    now = 0
+    start = time.perf_counter()
+    for index, (ts, reaction, delta) in enumerate(events):
+        now += EVENT_INTERVAL_IN_SECONDS
+        aggregator.add('C', ts, reaction, delta, now=now)
+        if index % FLUSH_EVERY == 0:
+            aggregator.flush(now=now, update=update)
+    aggregator.flush(now=now + FLUSH_DELAY_IN_SECONDS, update=update)
+    elapsed = time.perf_counter() - start
+
+    return count / elapsed, len(updates)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    posts = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    per_second, updates = run(count, posts)
+    print("{} reactions on {} posts: {:,.0f} reactions/s, {} updates"
+          .format(count, posts, per_second, updates))
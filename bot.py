@@ -2,30 +2,44 @@
 import logging
 import time
 
-from freespace.config import config
+from freespace.config import config, config_files_changed, load_config
+from freespace.errors import SlackClientFailedInit
+from freespace.rate_limiter import flood_guard
+from freespace.reactions import aggregator
 from freespace.rtm_handlers import handle
+from freespace.scheduler import save_scheduler, scheduler
 from freespace.slack_client import slack
+from freespace.thread_context import contexts
 
 
 
-def handle_command(command, channel):
+def handle_command(command, channel, thread_ts=None):
     """
     Receives commands directed at the bot and determines if they are valid
     commands. If so, then acts on the commands. If not, returns back what it
-    needs for clarification.
+    needs for clarification. Commands made in a thread keep their state from
+    one message to the next.
 
     :param command:
-    :param command:
+    :param channel:
+    :param thread_ts: Timestamp of the parent message if the command was made
+        in a thread.
 
     :return:
     """
     response = ("Not sure what you mean. Use the *do* command with numbers, "
                 "delimited by spaces.")
 
+    context = contexts.get(channel, thread_ts) if thread_ts else None
+
     if command.startswith('do'):
         response = "Sure...write some more code then I can do that!"
-    slack_client.api_call("chat.postMessage", channel=channel, text=response,
-                          as_user=True)
+        if thread_ts:
+            step = context['step'] + 1 if context else 1
+            contexts.set(channel, thread_ts, {'command': 'do', 'step': step})
+            response = "{} (step {})".format(response, step)
+    slack.send_message(response, channel=channel, thread_ts=thread_ts,
+                       as_user=True)
 
 
 def handle_message(rtm_output):
@@ -70,13 +84,77 @@ def handle_slack_output(slack_rtm_output):
     return None, None
 
 
+# Config keys that can't be applied without reconnecting the client
+RECONNECT_KEYS = {'SLACK.TOKEN', 'BOT.NAME'}
+
+
+def reload_config():
+    """
+    Load the config files again if they changed and apply the changes to the
+    running bot. Values read on use, such as the delays, need nothing else.
+
+    :return: True if the changes require to reconnect the client, False
+        otherwise.
+    """
+    if not config_files_changed():
+        return False
+
+    try:
+        changes = load_config()
+    except Exception:
+        logging.exception("failed to reload the config, keeping the current "
+                          "one")
+        return False
+
+    if not changes:
+        return False
+    logging.info("config reloaded, changed: {}"
+                 .format(", ".join(sorted(changes))))
+
+    if any(change.startswith('RATE_LIMIT.') for change in changes):
+        flood_guard.configure()
+
+    if any(change.startswith('REACTIONS.') for change in changes):
+        aggregator.flush_delay = config.REACTIONS.FLUSH_DELAY_IN_SECONDS
+        aggregator.max_messages = config.REACTIONS.MAX_TRACKED_MESSAGES
+
+    if any(change.startswith('THREAD_CONTEXT.') for change in changes):
+        contexts.ttl = config.THREAD_CONTEXT.TTL_IN_SECONDS
+        contexts.max_bytes = config.THREAD_CONTEXT.MAX_MEMORY_IN_BYTES
+        spill_path = (config.THREAD_CONTEXT.SPILL_PATH
+                      if config.THREAD_CONTEXT.SPILL else None)
+        if spill_path != contexts.spill_path:
+            contexts.open_spill(spill_path)
+        contexts.spill_min_age = config.THREAD_CONTEXT.SPILL_MIN_AGE_IN_SECONDS
+
+    # Reconnecting resolves the channels again, so it's done last and only if
+    # needed
+    if changes & RECONNECT_KEYS:
+        logging.info("reconnecting the Slack client to apply the config")
+        slack.reset_client()
+        return True
+
+    if 'CHANNEL.NAMES' in changes:
+        try:
+            slack.resolve_channels()
+        except SlackClientFailedInit:
+            logging.exception("failed to resolve the channels of the new "
+                              "config")
+
+    return False
+
+
 def start():
     """
     Start a connection to the RTM event stream and an infinite loop attempting
     to read from the stream and react to events with the handlers function.
+    Scheduled jobs and reactions tallies are run from the same loop.
     """
+    last_save = last_config_check = time.monotonic()
 
     while True:
+        reconnect = False
+
         # Attempt connection to the Slack RTM event stream
         if slack.start_rtm():
             connected = True
@@ -88,14 +166,44 @@ def start():
             try:
                 logging.info("reading..")
                 handle(slack.read_rtm_stream())
+                scheduler.run_pending()
+                aggregator.flush()
+
+                # Jobs that ran are in the journal, the snapshot is only
+                # written again once the journal grew long enough
+                if (time.monotonic() - last_save >
+                        config.SCHEDULER.SAVE_INTERVAL_IN_SECONDS):
+                    save_scheduler()
+                    last_save = time.monotonic()
+
+                if (config.FREESPACE.CONFIG_WATCH and
+                        time.monotonic() - last_config_check >
+                        config.FREESPACE.CONFIG_WATCH_INTERVAL_IN_SECONDS):
+                    last_config_check = time.monotonic()
+                    if reload_config():
+                        # Reconnect right away with the new config
+                        reconnect = True
+                        break
+
                 time.sleep(config.SLACK.RTM_READ_DELAY_IN_SECONDS)
-            except:
+            except Exception:
                 # Something went wrong, get out of the read loop
                 logging.exception("stopping read")
                 connected = False
 
-        # Sleep for a while before retrying to connect to the stream
+        if reconnect:
+            continue
+
+        # Sleep for a while before retrying to connect to the stream, a fixed
+        # config (e.g. a wrong token) is picked up before the next attempt
+        scheduler.run_pending()
         time.sleep(config.SLACK.RTM_RETRY_DELAY_IN_SECONDS)
+        if config.FREESPACE.CONFIG_WATCH:
+            last_config_check = time.monotonic()
+            try:
+                reload_config()
+            except Exception:
+                logging.exception("failed to apply the config")
 
 
 def test():
@@ -1,11 +1,16 @@
 
-from configparser import RawConfigParser
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
 import sys
 
 config = None
+loaded_cache_key = None
+logging_handlers = []
+
+# Compiled version of the config files, rebuilt when one of them changes
+CACHE_PATH = os.path.join(os.path.dirname(__file__), '.freespace_cfg.cache')
+CACHE_VERSION = 1
 
 
 class Config:
@@ -89,7 +94,7 @@ class Config:
             if section_name not in self.__dict__:
                 self.__dict__[section_name] = Config()
 
-    def add(self, data, value=None, uppercase=True):
+    def add(self, data, value=None, uppercase=True, parse=True):
         """
         Add one or more key(s)/value(s) to the config object
 
@@ -103,18 +108,33 @@ class Config:
         :param uppercase: A boolean value to set the key to be all uppercase
             or not.
         :rtype uppercase: bool
+        :param parse: Set to False if the values were already parsed and
+            should be stored as is.
+        :rtype parse: bool
         """
 
         if isinstance(data, dict):
             for key, value in data.items():
                 if uppercase:
                     key = key.upper()
-                self.__dict__[key] = self.parse_value(value)
+                if parse:
+                    value = self.parse_value(value)
+                self.__dict__[key] = value
         # Only insert a single key/value if a value was passed
         elif value:
             if uppercase:
                 data = data.upper()
-            self.__dict__[data] = self.parse_value(value)
+            self.__dict__[data] = self.parse_value(value) if parse else value
+
+    def to_dict(self):
+        """
+        Get the sections of the config and their values as plain dicts.
+
+        :return: A dict of section name to a dict of key/value.
+        """
+        return {section_name: dict(section.__dict__)
+                for section_name, section in self.__dict__.items()
+                if isinstance(section, Config)}
 
     @staticmethod
     def parse_value(value, remove_quotes=True):
@@ -179,17 +199,13 @@ class Config:
         return value
 
 
-def load_config():
-    """
-    Load the content of the different configuration files of the project in a
-    global config object to be imported into other modules.
+def get_load_order():
     """
+    Get the paths of the possible configs. Order: increasing in priority
 
-    global config
-    config = Config()
-
-    # Set loading order of the possible configs. Order: increasing in priority
-    load_order = [
+    :return: A list of paths to config files, some of them may not exist.
+    """
+    return [
         # Default config
         os.path.join(os.path.dirname(__file__), 'freespace_default.cfg'),
         # Local override
@@ -197,46 +213,235 @@ def load_config():
         # Server override
         '/etc/freespace/freespace.cfg']
 
+
+def get_cache_key(load_order):
+    """
+    Identify the current state of the config files by their modification time
+    and size.
+
+    :param load_order: The paths of the config files.
+    :rtype load_order: list
+
+    :return: A list that changes whenever one of the config files changes.
+    """
+    cache_key = [CACHE_VERSION]
+    for conf_path in load_order:
+        try:
+            stat = os.stat(conf_path)
+            cache_key.append([conf_path, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            cache_key.append([conf_path, None, None])
+    return cache_key
+
+
+def read_cache(cache_key):
+    """
+    Read the compiled config if it was built from the same config files.
+
+    :param cache_key: The current state of the config files.
+    :rtype cache_key: list
+
+    :return: A dict of section name to a dict of key/value or None if there is
+        no valid cache.
+    """
+    try:
+        with open(CACHE_PATH, encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+        if cache.get('key') == cache_key:
+            return cache['sections']
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def write_cache(cache_key, sections):
+    """
+    Save the compiled config. Failing to write the cache is not an error, the
+    config files will just be parsed again next time.
+    """
+    try:
+        tmp_path = "{}.tmp".format(CACHE_PATH)
+        with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump({'key': cache_key, 'sections': sections}, cache_file)
+        os.replace(tmp_path, CACHE_PATH)
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+def parse_config_files(load_order):
+    """
+    Parse the config files in order and merge them in a new Config object.
+
+    :param load_order: The paths of the config files, increasing in priority.
+    :rtype load_order: list
+
+    :return: A Config object.
+    """
+    from configparser import RawConfigParser
+
+    new_config = Config()
+
     # Load conf files and set the sections and values in the config object
     for conf_path in load_order:
         if os.path.isfile(conf_path):
             config_parser = RawConfigParser()
             config_parser.read(conf_path)
-            config.add_section(config_parser.sections())
+            new_config.add_section(config_parser.sections())
             for section in config_parser.sections():
-                config.add_section(section)
+                new_config.add_section(section)
+                config_section = getattr(new_config, section)
                 for section_key, section_value in config_parser.items(section):
-                    getattr(config, section).add(section_key, section_value)
+                    config_section.add(section_key, section_value)
+
+    return new_config
+
+
+def config_files_changed():
+    """
+    Verify if one of the config files changed since the config was loaded.
+    Only looks at the modification time and size of the files so it's cheap
+    enough to be called from the main loop.
+
+    :return: True if the config files changed, False otherwise.
+    """
+    return get_cache_key(get_load_order()) != loaded_cache_key
+
+
+def load_config():
+    """
+    Load the content of the different configuration files of the project in a
+    global config object to be imported into other modules. The parsed config
+    is cached and only parsed again when one of the files changes.
 
-    load_logging_config()
+    When the config was already loaded, the global config object is updated in
+    place, all at once, so modules that imported it see the new values.
+
+    :return: A set of the "SECTION.KEY" that changed. On the first load, every
+        key is considered as changed.
+    """
+
+    global config, loaded_cache_key
+
+    load_order = get_load_order()
+    cache_key = get_cache_key(load_order)
+    sections = read_cache(cache_key)
+
+    if sections is None:
+        new_config = parse_config_files(load_order)
+        sections = new_config.to_dict()
+        write_cache(cache_key, sections)
+    else:
+        new_config = Config()
+        for section_name, values in sections.items():
+            new_config.add_section(section_name)
+            getattr(new_config, section_name).add(values, parse=False)
+
+    old_sections = config.to_dict() if config else {}
+    changes = set()
+    for section_name in old_sections.keys() | sections.keys():
+        old_values = old_sections.get(section_name, {})
+        new_values = sections.get(section_name, {})
+        for key in old_values.keys() | new_values.keys():
+            if (key not in old_values or key not in new_values or
+                    old_values[key] != new_values[key]):
+                changes.add("{}.{}".format(section_name, key))
+
+    # Build the logging handlers first, an invalid logging config raises
+    # before anything is changed
+    logging_setup = None
+    if any(change.startswith('LOGGING.') for change in changes):
+        logging_setup = create_logging_handlers(new_config)
+
+    if config is None:
+        config = new_config
+        if logging_setup:
+            apply_logging_handlers(*logging_setup)
+    else:
+        old_dict = config.__dict__
+        config.__dict__ = new_config.__dict__
+        try:
+            if logging_setup:
+                apply_logging_handlers(*logging_setup)
+        except Exception:
+            config.__dict__ = old_dict
+            raise
+    loaded_cache_key = cache_key
+
+    return changes
+
+
+def create_logging_handlers(new_config):
+    """
+    Create the logging handlers defined in a config without adding them to the
+    root logger yet.
+
+    :param new_config: The config to read the logging settings from.
+    :rtype new_config: Config
+
+    :return: A tuple of the root logger level and the list of handlers.
+    :raise ValueError: If a logging setting is invalid, e.g. an unknown level.
+    """
+    # Raises on an unknown level without touching the root logger
+    logging.Logger(__name__).setLevel(new_config.LOGGING.LOGGER_MIN_LEVEL)
+
+    formatter = logging.Formatter(
+        new_config.LOGGING.LOGGER_FORMAT,
+        style=new_config.LOGGING.LOGGER_FORMATTER_STYLE,
+        datefmt=new_config.LOGGING.LOGGER_DATE_FORMAT)
+    handlers = []
+
+    try:
+        # Create terminal channel
+        if new_config.LOGGING.LOGGER_TERMINAL:
+            channel_terminal = logging.StreamHandler(sys.stdout)
+            handlers.append(channel_terminal)
+            channel_terminal.setLevel(
+                new_config.LOGGING.LOGGER_TERMINAL_MIN_LEVEL)
+            channel_terminal.setFormatter(formatter)
+
+        # Create file channel
+        if new_config.LOGGING.LOGGER_FILE:
+            from logging.handlers import RotatingFileHandler
+
+            channel_file = RotatingFileHandler(
+                new_config.LOGGING.LOGGER_FILE_PATH,
+                encoding=new_config.FREESPACE.ENCODING,
+                backupCount=new_config.LOGGING.LOGGER_FILE_MAX_ROTATION,
+                maxBytes=new_config.LOGGING.LOGGER_FILE_MAX_SIZE)
+            handlers.append(channel_file)
+            channel_file.setLevel(new_config.LOGGING.LOGGER_FILE_MIN_LEVEL)
+            channel_file.setFormatter(formatter)
+    except Exception:
+        for handler in handlers:
+            handler.close()
+        raise
+
+    return new_config.LOGGING.LOGGER_MIN_LEVEL, handlers
+
+
+def apply_logging_handlers(level, handlers):
+    """
+    Replace the handlers added to the root logger by a previous call.
+
+    :param level: The level of the root logger.
+    :param handlers: The handlers to add to the root logger.
+    :rtype handlers: list
+    """
+    logger = logging.getLogger()
+    for handler in logging_handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    logging_handlers.clear()
+
+    logger.setLevel(level)
+    for handler in handlers:
+        logger.addHandler(handler)
+        logging_handlers.append(handler)
 
 
 def load_logging_config():
     """
     Load the different logging config as defined in the global config of the
-    application.
+    application. Handlers added by a previous call are replaced.
     """
-    logger = logging.getLogger()
-    logger.setLevel(config.LOGGING.LOGGER_MIN_LEVEL)
-
-    formatter = logging.Formatter(config.LOGGING.LOGGER_FORMAT,
-                                  style=config.LOGGING.LOGGER_FORMATTER_STYLE,
-                                  datefmt=config.LOGGING.LOGGER_DATE_FORMAT)
-
-    # Create terminal channel
-    if config.LOGGING.LOGGER_TERMINAL:
-        channel_terminal = logging.StreamHandler(sys.stdout)
-        channel_terminal.setLevel(config.LOGGING.LOGGER_TERMINAL_MIN_LEVEL)
-        channel_terminal.setFormatter(formatter)
-        logger.addHandler(channel_terminal)
-
-    # Create file channel
-    if config.LOGGING.LOGGER_FILE:
-        channel_file = RotatingFileHandler(
-            config.LOGGING.LOGGER_FILE_PATH,
-            encoding=config.FREESPACE.ENCODING,
-            backupCount=config.LOGGING.LOGGER_FILE_MAX_ROTATION,
-            maxBytes=config.LOGGING.LOGGER_FILE_MAX_SIZE)
-        channel_file.setLevel(config.LOGGING.LOGGER_FILE_MIN_LEVEL)
-        channel_file.setFormatter(formatter)
-        logger.addHandler(channel_file)
+    apply_logging_handlers(*create_logging_handlers(config))
@@ -1,22 +1,102 @@
+import os
+import signal
+import sys
+import time
+
+
+def get_start_time():
+    """
+    Get the time the process was started at, on the time.perf_counter() scale,
+    so the startup report includes the start of the interpreter. Read from
+    /proc on Linux, other platforms fall back to the import of this module.
+
+    :return: The start time of the process in seconds.
+    """
+    now = time.perf_counter()
+    try:
+        with open('/proc/self/stat') as stat_file:
+            # The name of the command is in parentheses and may contain spaces
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        # starttime is the 22nd field, in clock ticks since boot
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return now - max(uptime - started, 0)
+    except (OSError, ValueError, IndexError):
+        return now
+
+
+START_TIME = get_start_time()
 
 from freespace.config import load_config
 
 
-def freespace_init():
+def print_startup_report(timings):
+    """
+    Print how long each step of the startup took, from the start of the
+    process to the first call made to the Slack API. Use
+    `python -X importtime` for a per module breakdown of the imports.
+
+    :param timings: A list of (step name, time in seconds) in the order they
+        ended.
+    :rtype timings: list
+    """
+    previous = 0
+    for step, elapsed in timings:
+        print("{:>10.1f} ms  {}".format((elapsed - previous) * 1000, step),
+              file=sys.stderr)
+        previous = elapsed
+    print("{:>10.1f} ms  total".format(previous * 1000), file=sys.stderr)
+
+
+def freespace_init(startup_report=False):
     """
     Initialize the configuration, logging and initialize the Stack client.
     Call the main application loop.
+
+    :param startup_report: Print the time spent on each step of the startup
+        and exit once connected instead of starting the main loop.
+    :rtype startup_report: bool
     """
+    timings = [('interpreter start and imports',
+                time.perf_counter() - START_TIME)]
+
     load_config()
+    timings.append(('load_config', time.perf_counter() - START_TIME))
 
     # Now that the config has been loaded, it's safe to load the adapters
     from freespace.slack_client import start_client
     start_client()  # Initialize global instance of the Slack client
+    timings.append(('start_client (first API call)',
+                    time.perf_counter() - START_TIME))
+
+    if startup_report:
+        print_startup_report(timings)
+        return
+
+    from freespace.rate_limiter import start_flood_guard
+    start_flood_guard()  # Initialize global instance of the flood protection
+
+    from freespace.scheduler import save_scheduler, start_scheduler
+    start_scheduler()  # Initialize global instance of the scheduler
+
+    from freespace.reactions import start_aggregator
+    start_aggregator()  # Initialize global instance of the reactions tallies
+
+    from freespace.thread_context import close_contexts, start_contexts
+    start_contexts()  # Initialize global instance of the thread contexts
+
+    # Exit through the finally below on a service stop, to save the state
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     # Start the bot
     from freespace import bot
-    bot.start()  # Start main loop
+    try:
+        bot.start()  # Start main loop
+    finally:
+        save_scheduler(final=True)
+        close_contexts()
 
 
 if __name__ == '__main__':
-    freespace_init()
+    freespace_init(startup_report='--startup-report' in sys.argv[1:])
@@ -0,0 +1,187 @@
+"""
+Flood protection for the messages relayed by the bot.
+
+Every user and every channel gets an approximate sliding-window counter. The
+counters are kept in a fixed-size table evicting the least recently used key
+once full, so the memory used stays bounded whatever the number of users.
+"""
+
+from collections import OrderedDict
+import logging
+import time
+
+from freespace.config import config
+from freespace.slack_client import slack
+
+
+# Message subtypes that are not new posts from a user
+EXEMPT_SUBTYPES = {
+    'message_changed',
+    'message_deleted',
+    'message_replied',
+    'bot_message',
+    'channel_join',
+    'channel_leave',
+    'channel_topic',
+    'channel_purpose',
+    'channel_name',
+    'pinned_item',
+    'unpinned_item'
+}
+
+flood_guard = None
+
+
+class RateLimiter:
+    """
+    Approximate sliding-window rate limiter keyed by an arbitrary string.
+
+    Each key stores the start of its current window, the number of events in
+    the previous window and the number of events in the current window. The
+    count over the sliding window is estimated by weighting the previous
+    window by the portion of it still covered by the sliding window.
+    """
+
+    def __init__(self, max_events, window, max_keys):
+        """
+        :param max_events: Maximum number of events allowed per key inside
+            the window.
+        :rtype max_events: int
+        :param window: Length of the window in seconds.
+        :rtype window: float
+        :param max_keys: Maximum number of keys tracked at once. The least
+            recently used key is dropped when the table is full.
+        :rtype max_keys: int
+        """
+        self.max_events = max_events
+        self.window = window
+        self.max_keys = max_keys
+        self._counters = OrderedDict()
+
+    def configure(self, max_events, window, max_keys):
+        """
+        Change the limits while keeping the current counters. Keys are evicted
+        if the table is now over its maximum size.
+        """
+        self.max_events = max_events
+        self.window = window
+        self.max_keys = max_keys
+        while len(self._counters) > self.max_keys:
+            self._counters.popitem(last=False)
+
+    def __len__(self):
+        return len(self._counters)
+
+    def allow(self, key, now=None):
+        """
+        Register an event for a key if the key is still under its limit.
+
+        :param key: The key to count the event against, e.g. a Slack user ID.
+        :rtype key: str
+        :param now: Current time in seconds, defaults to time.monotonic().
+        :rtype now: float
+
+        :return: True if the event is allowed, False if the key is over its
+            limit. Refused events are not counted.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = [now, 0, 0]  # [window start, previous, current]
+            self._counters[key] = counter
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+
+        # Slide the window forward if needed
+        elapsed = now - counter[0]
+        if elapsed >= self.window:
+            windows_passed = int(elapsed // self.window)
+            counter[1] = counter[2] if windows_passed == 1 else 0
+            counter[2] = 0
+            counter[0] += windows_passed * self.window
+            elapsed = now - counter[0]
+
+        weight = (self.window - elapsed) / self.window
+        if counter[1] * weight + counter[2] >= self.max_events:
+            return False
+
+        counter[2] += 1
+        return True
+
+
+class FloodGuard:
+    """
+    Combine a per-user and a per-channel rate limiter. A user is checked
+    against its own limit first so a single spammer only consumes its own
+    allowance and not the allowance of the channel.
+    """
+
+    def __init__(self):
+        self.users = None
+        self.channels = None
+        self.configure()
+
+    def configure(self):
+        """
+        Apply the values of config.RATE_LIMIT to the rate limiters. Counters
+        are kept when the limiters already exist.
+        """
+        users_limits = (config.RATE_LIMIT.USER_MAX_MESSAGES,
+                        config.RATE_LIMIT.USER_WINDOW_IN_SECONDS,
+                        config.RATE_LIMIT.MAX_TRACKED_KEYS)
+        channels_limits = (config.RATE_LIMIT.CHANNEL_MAX_MESSAGES,
+                           config.RATE_LIMIT.CHANNEL_WINDOW_IN_SECONDS,
+                           config.RATE_LIMIT.MAX_TRACKED_KEYS)
+
+        if self.users is None:
+            self.users = RateLimiter(*users_limits)
+            self.channels = RateLimiter(*channels_limits)
+        else:
+            self.users.configure(*users_limits)
+            self.channels.configure(*channels_limits)
+
+    def is_allowed(self, event):
+        """
+        Verify if an RTM event can be processed or if it should be dropped.
+
+        :param event: A Slack RTM event.
+        :rtype event: dict
+
+        :return: True if neither the user nor the channel of the event are
+            over their limit or if the event is not a new message from a user,
+            False otherwise.
+        """
+        if not config.RATE_LIMIT.ENABLED:
+            return True
+
+        # Only new messages posted by users count. Edits, deletes and the
+        # posts of the bot would otherwise use the allowance of everyone.
+        # Other subtypes, such as file_share, are new posts and do count.
+        if event.get('subtype') in EXEMPT_SUBTYPES or event.get('bot_id'):
+            return True
+
+        user = event.get('user')
+        if not user or user == slack.user_id:
+            return True
+
+        if not self.users.allow(user):
+            logging.info("user {} is over its rate limit, dropping event"
+                         .format(user))
+            return False
+
+        channel = event.get('channel')
+        if channel and not self.channels.allow(channel):
+            logging.info("channel {} is over its rate limit, dropping event"
+                         .format(channel))
+            return False
+
+        return True
+
+
+def start_flood_guard():
+    global flood_guard
+    flood_guard = FloodGuard()
@@ -0,0 +1,197 @@
+"""
+Live tally of the reactions on the posts of the bot, to be used for polls and
+votes.
+
+Counts are kept up to date from the reaction_added and reaction_removed RTM
+events instead of asking Slack for them. A post is updated at most once every
+FLUSH_DELAY_IN_SECONDS: the changes made within that delay after its first
+change are sent together, and only if its tally is different from the one
+already shown.
+"""
+
+from collections import OrderedDict
+import logging
+import time
+
+from freespace.config import config
+from freespace.slack_client import slack
+
+
+aggregator = None
+
+
+class Tally:
+    __slots__ = ('text', 'counts', 'shown')
+
+    def __init__(self, text, counts=None):
+        self.text = text
+        self.counts = counts or {}
+        self.shown = self.render()
+
+    def render(self):
+        """
+        :return: A str listing the reactions from the most to the least used.
+        """
+        return "  ".join(
+            ":{}: {}".format(reaction, count) for reaction, count in
+            sorted(self.counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+class ReactionAggregator:
+    def __init__(self, flush_delay, max_messages):
+        """
+        :param flush_delay: Delay in seconds to wait after the first change
+            of a post before updating it.
+        :rtype flush_delay: float
+        :param max_messages: Maximum number of posts tracked at once. The
+            least recently used post is dropped when the table is full.
+        :rtype max_messages: int
+        """
+        self.flush_delay = flush_delay
+        self.max_messages = max_messages
+        self.tallies = OrderedDict()  # (channel, ts): Tally
+        self.pending = OrderedDict()  # (channel, ts): time of first change
+
+    def track(self, channel, ts, text, counts=None):
+        """
+        Start keeping a tally for a message, if it's not already tracked.
+
+        :param channel: The Slack channel ID of the message.
+        :param ts: Timestamp of the message.
+        :param text: Text of the message, kept when the tally is updated.
+        :param counts: Reactions already on the message, as a dict of reaction
+            name to count.
+        """
+        key = (channel, ts)
+        if key in self.tallies:
+            self.tallies.move_to_end(key)
+            return
+
+        self.tallies[key] = Tally(text, counts)
+        if len(self.tallies) > self.max_messages:
+            old_key, _ = self.tallies.popitem(last=False)
+            self.pending.pop(old_key, None)
+
+    def add(self, channel, ts, reaction, delta, now=None):
+        """
+        Count a reaction added (delta=1) or removed (delta=-1) on a tracked
+        message. Reactions on untracked messages are ignored.
+
+        :return: True if the message is tracked, False otherwise.
+        """
+        key = (channel, ts)
+        tally = self.tallies.get(key)
+        if tally is None:
+            return False
+        self.tallies.move_to_end(key)
+
+        count = tally.counts.get(reaction, 0) + delta
+        if count > 0:
+            tally.counts[reaction] = count
+        else:
+            tally.counts.pop(reaction, None)
+
+        if key not in self.pending:
+            self.pending[key] = time.monotonic() if now is None else now
+        return True
+
+    def flush(self, now=None, update=None):
+        """
+        Update the posts whose flush delay expired and whose tally changed.
+
+        :param now: Current time in seconds, defaults to time.monotonic().
+        :rtype now: float
+        :param update: Function called with the channel, ts, text and
+            attachments of a post to update, defaults to Slack.update_message.
+
+        :return: The number of posts updated.
+        """
+        if now is None:
+            now = time.monotonic()
+        update = update or slack.update_message
+        count = 0
+
+        # Pending posts are in the order of their first change, so they are
+        # also in the order they are due, whatever the current delay is
+        while self.pending:
+            key, changed = next(iter(self.pending.items()))
+            if changed + self.flush_delay > now:
+                break
+            del self.pending[key]
+
+            tally = self.tallies.get(key)
+            rendered = tally.render()
+            if rendered == tally.shown:
+                continue
+
+            channel, ts = key
+            update(channel=channel, ts=ts, text=tally.text,
+                   attachments=[{'text': rendered}] if rendered else [])
+            tally.shown = rendered
+            count += 1
+
+        return count
+
+    def rebuild(self, channel, messages):
+        """
+        Track the messages posted by the bot in a channel, with the reactions
+        they already have.
+
+        :param channel: The Slack channel ID of the messages.
+        :param messages: Messages as returned by Slack.get_channel_history.
+        :rtype messages: list
+        """
+        # History is newest first, track the oldest first to keep LRU order
+        for message in reversed(messages):
+            if not is_bot_message(message) or not message.get('ts'):
+                continue
+            counts = {reaction['name']: reaction['count']
+                      for reaction in message.get('reactions', [])}
+            self.track(channel, message['ts'], message.get('text', ''), counts)
+
+
+def is_bot_message(message):
+    """
+    :return: True if the message was posted by the bot, either as its user or
+        as a bot_message using its name.
+    """
+    if message.get('user') and message.get('user') == slack.user_id:
+        return True
+    return (message.get('subtype') == 'bot_message' and
+            message.get('username') == config.BOT.NAME)
+
+
+def handle_bot_message(event):
+    """
+    Start a tally for a message event of a post of the bot.
+    """
+    if config.REACTIONS.ENABLED and is_bot_message(event) and event.get('ts'):
+        aggregator.track(event.get('channel'), event['ts'],
+                         event.get('text', ''))
+
+
+def handle_reaction(event, delta):
+    """
+    Count a reaction_added or reaction_removed RTM event.
+    """
+    item = event.get('item') or {}
+    if config.REACTIONS.ENABLED and item.get('type') == 'message':
+        aggregator.add(item.get('channel'), item.get('ts'),
+                       event.get('reaction'), delta)
+
+
+def start_aggregator():
+    global aggregator
+    aggregator = ReactionAggregator(config.REACTIONS.FLUSH_DELAY_IN_SECONDS,
+                                    config.REACTIONS.MAX_TRACKED_MESSAGES)
+
+    if not config.REACTIONS.ENABLED:
+        return
+
+    for channel_name, channel_id in slack.channels.items():
+        logging.info("rebuilding reactions tallies for channel {}"
+                     .format(channel_name))
+        aggregator.rebuild(
+            channel_id,
+            slack.get_channel_history(channel_id,
+                                      config.REACTIONS.HISTORY_COUNT))
@@ -7,6 +7,10 @@ List of interesting events type:
 
 import logging
 
+from freespace.rate_limiter import flood_guard
+from freespace.reactions import handle_bot_message, handle_reaction
+from freespace.slack_client import slack
+
 
 def handle_unknown(event):
     logging.warning("RTM event of type {} received, this event type is not "
@@ -22,11 +26,46 @@ def handle_not_implemented(event):
 
 def handle_message(event):
     logging.info("received message event")
+    handle_bot_message(event)
+    if not flood_guard.is_allowed(event):
+        return
     logging.debug(event)
+    handle_mention(event)
+
+
+def handle_mention(event):
+    """
+    Send the new messages starting with a mention of the bot to the command
+    handler. The reply goes in the thread of the message, or starts one, so
+    the command keeps its state over the next messages of the thread.
+    """
+    # Imported here, bot imports this module
+    from freespace.bot import handle_command
+
+    if event.get('subtype') or not slack.user_id:
+        return
+
+    mention = '<@{}>'.format(slack.user_id)
+    text = (event.get('text') or '').strip()
+    if event.get('user') == slack.user_id or not text.startswith(mention):
+        return
+
+    handle_command(text[len(mention):].strip().lower(), event.get('channel'),
+                   event.get('thread_ts') or event.get('ts'))
+
+
+def handle_reaction_added(event):
+    handle_reaction(event, 1)
+
+
+def handle_reaction_removed(event):
+    handle_reaction(event, -1)
 
 
 type_events = {
-    'message': handle_message
+    'message': handle_message,
+    'reaction_added': handle_reaction_added,
+    'reaction_removed': handle_reaction_removed
 }
 
 
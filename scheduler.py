@@ -0,0 +1,418 @@
+"""
+Hierarchical timing wheel used to run delayed and recurring jobs from the
+main loop of the bot (expiring posts, scheduled announcements, delayed
+deletes, ...).
+
+Each level of the wheel has WHEEL_SIZE slots, a slot of level N spanning
+WHEEL_SIZE ** N ticks. A timer is put in the lowest level able to hold its
+delay and moves down a level each time the wheel of the level below completes
+a turn. Inserting and cancelling a timer are O(1).
+
+Jobs are stored as an action name and its keyword arguments so the pending
+timers can be saved to disk and loaded back after a restart. Each change to
+the timers (added, moved, removed) is appended to a journal, an O(1) write.
+The full snapshot is only written back, and the journal emptied, once the
+journal holds more entries than there are pending timers and on shutdown.
+"""
+
+import json
+import logging
+import os
+import time
+
+from freespace.config import config
+from freespace.slack_client import slack
+
+
+WHEEL_BITS = 6
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+WHEEL_LEVELS = 4
+
+scheduler = None
+
+actions = {
+    'send_message': slack.send_message,
+    'update_message': slack.update_message,
+    'delete_message': slack.delete_message
+}
+
+
+# Minimum number of journal entries before the snapshot is written again
+JOURNAL_MIN_ENTRIES = 1000
+
+
+class Timer:
+    __slots__ = ('timer_id', 'expires', 'interval', 'action', 'kwargs',
+                 'bucket')
+
+    def __init__(self, timer_id, expires, interval, action, kwargs):
+        self.timer_id = timer_id
+        self.expires = expires
+        self.interval = interval
+        self.action = action
+        self.kwargs = kwargs
+        self.bucket = None
+
+
+class Scheduler:
+    def __init__(self, tick=1.0, now=None):
+        """
+        :param tick: Resolution of the wheel in seconds.
+        :rtype tick: float
+        :param now: Current time in seconds since the epoch, defaults to
+            time.time().
+        :rtype now: float
+        """
+        self.tick = tick
+        self.current_tick = self._to_tick(time.time() if now is None else now)
+        self.wheels = [[set() for _ in range(WHEEL_SIZE)]
+                       for _ in range(WHEEL_LEVELS)]
+        self.count = 0
+        self.next_id = 1
+        self.dirty = False
+        self.journal = None
+        self.journal_entries = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for wheel in self.wheels:
+            for bucket in wheel:
+                yield from bucket
+
+    def _to_tick(self, seconds):
+        return int(seconds / self.tick)
+
+    def _log(self, *entry):
+        """
+        Append a change to the journal, if one is open.
+        """
+        if self.journal:
+            self.journal.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self.journal_entries += 1
+
+    def open_journal(self, path):
+        """
+        Start appending the changes to the timers to a journal file, replayed
+        by load on top of the last snapshot.
+
+        :param path: Path of the journal file.
+        :rtype path: str
+        """
+        # Line buffered, each entry reaches the file as soon as it's written
+        self.journal = open(path, 'a', buffering=1,
+                            encoding=config.FREESPACE.ENCODING)
+        self._log('tick', self.tick)
+
+    def close_journal(self):
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    @property
+    def needs_snapshot(self):
+        """
+        :return: True once the journal is longer than the snapshot would be,
+            so writing the snapshot stays amortized O(1) per change.
+        """
+        return self.journal_entries > max(self.count, JOURNAL_MIN_ENTRIES)
+
+    def _place(self, timer):
+        """
+        Put a timer in the slot matching its expiration tick.
+        """
+        expires = max(timer.expires, self.current_tick)
+        delta = expires - self.current_tick
+
+        for level in range(WHEEL_LEVELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)):
+                break
+        else:
+            # Too far in the future, park it in the furthest slot. It will be
+            # placed again when this slot gets cascaded.
+            expires = (self.current_tick +
+                       (1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1)
+
+        bucket = self.wheels[level][(expires >> (WHEEL_BITS * level)) &
+                                    WHEEL_MASK]
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def schedule(self, action, delay, interval=None, now=None, **kwargs):
+        """
+        Schedule a job to run after a delay, and optionally to repeat.
+
+        :param action: Name of the job to run, must be a key of actions.
+        :rtype action: str
+        :param delay: Delay in seconds before the job runs.
+        :rtype delay: float
+        :param interval: If set, the job runs again every interval seconds.
+        :rtype interval: float
+        :param now: Current time in seconds since the epoch, defaults to
+            time.time(). The delay starts from now, not from the last call to
+            run_pending.
+        :rtype now: float
+        :param kwargs: Key arguments passed to the job.
+
+        :return: The Timer object, to be used to cancel it.
+        """
+        if action not in actions:
+            raise ValueError("unknown scheduler action: {}".format(action))
+
+        if now is None:
+            now = time.time()
+
+        timer = Timer(
+            self.next_id,
+            max(self._to_tick(now + max(delay, 0)), self.current_tick),
+            max(self._to_tick(interval), 1) if interval else None,
+            action, kwargs)
+        self.next_id += 1
+        self._place(timer)
+        self.count += 1
+        self.dirty = True
+        self._log('add', timer.timer_id, timer.expires, timer.interval,
+                  timer.action, timer.kwargs)
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancel a pending timer.
+
+        :param timer: The Timer returned by schedule.
+        :rtype timer: Timer
+
+        :return: True if a pending timer was cancelled, False otherwise.
+        """
+        if timer.bucket is None:
+            return False
+
+        timer.bucket.discard(timer)
+        timer.bucket = None
+        self.count -= 1
+        self.dirty = True
+        self._log('remove', timer.timer_id)
+        return True
+
+    def _cascade(self, level):
+        """
+        Move the timers of the current slot of a level to the lower levels.
+
+        :return: The index of the slot that was cascaded.
+        """
+        index = (self.current_tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+        bucket = self.wheels[level][index]
+        self.wheels[level][index] = set()
+        for timer in bucket:
+            self._place(timer)
+        return index
+
+    def _run(self, timer):
+        try:
+            actions[timer.action](**timer.kwargs)
+        except Exception:
+            logging.exception("scheduled job {} failed".format(timer.action))
+
+    def run_pending(self, now=None):
+        """
+        Run all the jobs that expired since the last call.
+
+        :param now: Current time in seconds since the epoch, defaults to
+            time.time().
+        :rtype now: float
+
+        :return: The number of jobs that ran.
+        """
+        target = self._to_tick(time.time() if now is None else now)
+        count = 0
+
+        while self.current_tick <= target:
+            # Cascade higher levels each time a level completes a turn
+            for level in range(1, WHEEL_LEVELS):
+                if self.current_tick & ((1 << (WHEEL_BITS * level)) - 1):
+                    break
+                if self._cascade(level):
+                    break
+
+            index = self.current_tick & WHEEL_MASK
+            bucket = self.wheels[0][index]
+            self.wheels[0][index] = set()
+
+            for timer in bucket:
+                timer.bucket = None
+                # Logged before running, a job never runs twice because of a
+                # restart
+                if timer.interval:
+                    timer.expires = max(timer.expires + timer.interval,
+                                        self.current_tick + 1)
+                    self._place(timer)
+                    self._log('move', timer.timer_id, timer.expires)
+                else:
+                    self.count -= 1
+                    self._log('remove', timer.timer_id)
+                self._run(timer)
+                count += 1
+
+            if bucket:
+                self.dirty = True
+
+            # Nothing can fire before the next cascade of the first non empty
+            # level, skip the empty ticks up to it
+            step_bits = 0
+            for wheel in self.wheels:
+                if any(wheel):
+                    break
+                step_bits += WHEEL_BITS
+            if step_bits:
+                next_tick = ((self.current_tick >> step_bits) + 1) << step_bits
+                self.current_tick = min(next_tick, target + 1)
+            else:
+                self.current_tick += 1
+
+        return count
+
+    def save(self, path):
+        """
+        Save the pending timers to a file and empty the journal, now included
+        in the snapshot.
+
+        :param path: Path of the file to write to.
+        :rtype path: str
+        """
+        state = {
+            'tick': self.tick,
+            'next_id': self.next_id,
+            'timers': [[timer.timer_id, timer.expires, timer.interval,
+                        timer.action, timer.kwargs] for timer in self]
+        }
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, 'w', encoding=config.FREESPACE.ENCODING) as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+        if self.journal:
+            self.journal.seek(0)
+            self.journal.truncate()
+            self.journal_entries = 0
+            self._log('tick', self.tick)
+
+    def load(self, path, journal_path=None):
+        """
+        Load timers previously saved with save, then replay the journal
+        written since. Timers that expired while the bot was not running run
+        on the next call to run_pending.
+
+        :param path: Path of the snapshot file, may not exist.
+        :rtype path: str
+        :param journal_path: Path of the journal file, may not exist.
+        :rtype journal_path: str
+        """
+        timers = {}  # timer_id: [expires, interval, action, kwargs]
+        next_id = 1
+
+        if os.path.isfile(path):
+            with open(path, encoding=config.FREESPACE.ENCODING) as f:
+                state = json.load(f)
+            ratio = state['tick'] / self.tick
+            next_id = state.get('next_id', 1)
+            for timer_id, expires, interval, action, kwargs in \
+                    state['timers']:
+                timers[timer_id] = [expires * ratio,
+                                    interval * ratio if interval else None,
+                                    action, kwargs]
+
+        if journal_path and os.path.isfile(journal_path):
+            ratio = 1
+            with open(journal_path, encoding=config.FREESPACE.ENCODING) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line cut short by a crash
+                        logging.warning("skipping a corrupted line of the "
+                                        "scheduler journal")
+                        continue
+
+                    # Replaying must stay idempotent, the journal may still
+                    # hold entries already in the snapshot
+                    operation, args = entry[0], entry[1:]
+                    if operation == 'tick':
+                        ratio = args[0] / self.tick
+                    elif operation == 'add':
+                        timer_id, expires, interval, action, kwargs = args
+                        timers.setdefault(timer_id, [
+                            expires * ratio,
+                            interval * ratio if interval else None,
+                            action, kwargs])
+                        next_id = max(next_id, timer_id + 1)
+                    elif operation == 'move' and args[0] in timers:
+                        timers[args[0]][0] = args[1] * ratio
+                    elif operation == 'remove':
+                        timers.pop(args[0], None)
+
+        self.next_id = max(self.next_id, next_id)
+        for timer_id, (expires, interval, action, kwargs) in timers.items():
+            if action not in actions:
+                logging.warning("dropping saved timer with unknown action {}"
+                                .format(action))
+                continue
+            timer = Timer(timer_id, int(expires),
+                          max(int(interval), 1) if interval else None,
+                          action, kwargs)
+            self._place(timer)
+            self.count += 1
+            self.next_id = max(self.next_id, timer_id + 1)
+
+
+def get_journal_path():
+    return "{}.journal".format(config.SCHEDULER.STATE_FILE_PATH)
+
+
+def start_scheduler():
+    global scheduler
+    scheduler = Scheduler(config.SCHEDULER.TICK_IN_SECONDS)
+
+    if not config.SCHEDULER.PERSIST:
+        return
+
+    path = config.SCHEDULER.STATE_FILE_PATH
+    try:
+        scheduler.load(path, get_journal_path())
+        logging.info("loaded {} scheduled jobs".format(len(scheduler)))
+    except Exception:
+        logging.exception("failed to load the scheduled jobs from {}"
+                          .format(path))
+
+    try:
+        scheduler.open_journal(get_journal_path())
+    except Exception:
+        logging.exception("failed to open the scheduler journal, jobs will "
+                          "only be saved on the periodic snapshots")
+
+
+def save_scheduler(final=False):
+    """
+    Save the snapshot of the pending timers of the global scheduler if
+    persistence is enabled. Unless final, it's only written once the journal
+    grew longer than the snapshot.
+
+    :param final: Set to True on shutdown to always write the snapshot if
+        anything changed and close the journal.
+    :rtype final: bool
+    """
+    if not scheduler or not config.SCHEDULER.PERSIST:
+        return
+
+    if scheduler.needs_snapshot or (final and scheduler.dirty) or \
+            (not scheduler.journal and scheduler.dirty):
+        try:
+            scheduler.save(config.SCHEDULER.STATE_FILE_PATH)
+        except Exception:
+            logging.exception("failed to save the scheduled jobs to {}"
+                              .format(config.SCHEDULER.STATE_FILE_PATH))
+
+    if final:
+        scheduler.close_journal()
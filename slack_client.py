@@ -1,4 +1,5 @@
 
+import json
 import logging
 from slackclient import SlackClient
 
@@ -67,16 +68,43 @@ class Slack:
                 "(config.BOT.NAME)".format(config.BOT.NAME))
 
         # Get channels IDs
+        self.resolve_channels()
+        return True
+
+    def resolve_channels(self):
+        """
+        Fetch the ID of the channels named in config.CHANNEL.NAMES that were
+        not resolved yet and forget the channels no longer listed. The
+        channels are only replaced once every name has been resolved, a
+        failure leaves them untouched.
+
+        :return: True once all the channels have an ID.
+        """
+        channels = {}
         for channel_name in config.CHANNEL.NAMES:
+            if channel_name in self.channels:
+                channels[channel_name] = self.channels[channel_name]
+                continue
             channel = self.get_channel(name=channel_name)
             if channel and channel.get('id'):
-                self.channels[channel_name] = channel['id']
+                channels[channel_name] = channel['id']
             else:
                 raise SlackClientFailedInit(
                     "could not find a Slack channel ID for a channel named {} "
                     "(config.CHANNEL.NAMES)".format(channel_name))
+
+        self.channels = channels
         return True
 
+    def reset_client(self):
+        """
+        Drop the current client and the resolved IDs. The next call to
+        get_client will connect and initialize a new client.
+        """
+        self._client = None
+        self.channels = {}
+        self.user_id = ""
+
     def is_api_working(self):
         """
         Attempt to call the Slack API and request a response. Use this to
@@ -158,6 +186,22 @@ class Slack:
 
         return result_call.get('channel') or {}
 
+    def get_channel_history(self, channel_id, count=100):
+        """
+        Get the latest messages of a channel.
+
+        :param channel_id: A Slack channel ID.
+        :rtype channel_id: str
+        :param count: Number of messages to return, between 1 and 1000.
+        :rtype count: int
+
+        :return: A list of dict each representing a message, newest first, or
+            an empty list if something went wrong.
+        """
+        result_call = self.make_api_call(
+            'channels.history', channel=channel_id, count=count) or {}
+        return result_call.get('messages') or []
+
     def get_channels(self):
         """
         Get information on all the channels in a team.
@@ -291,6 +335,59 @@ class Slack:
 
         return result_call.get('message') or {}
 
+    def update_message(self, channel, ts, text, attachments=None,
+                       parse=None, link_names=True, as_user=False):
+        """
+        Update a message previously posted in a channel.
+
+        :param channel: The Slack channel ID containing the message.
+        :param ts: Timestamp of the message to be updated.
+        :param text: New text for the message.
+        :param attachments: Structured message attachments, an empty list
+            removes the current attachments.
+        :rtype attachments: list
+        :param parse: Change how messages are treated
+        :param link_names: Find and link channel names and usernames.
+        :param as_user: Pass true to update the message as the authed user.
+
+        :return: A dict with information on the updated message or an empty
+            dict in the case of failure.
+        """
+        message_kwargs = {
+            'channel': channel,
+            'ts': ts,
+            'text': text,
+            'parse': parse,
+            'link_names': link_names,
+            'as_user': as_user
+        }
+
+        # An empty list is sent too, it removes the attachments of the message
+        if attachments is not None:
+            message_kwargs['attachments'] = json.dumps(attachments)
+
+        result_call = self.make_api_call('chat.update', **message_kwargs) or {}
+
+        # Older API versions return the message fields at the top level
+        if result_call.get('message'):
+            return result_call['message']
+        return {key: value for key, value in result_call.items()
+                if key in ('channel', 'ts', 'text')}
+
+    def delete_message(self, channel, ts, as_user=False):
+        """
+        Delete a message from a channel.
+
+        :param channel: The Slack channel ID containing the message.
+        :param ts: Timestamp of the message to be deleted.
+        :param as_user: Pass true to delete the message as the authed user.
+
+        :return: True if the message was deleted, False otherwise.
+        """
+        result_call = self.make_api_call(
+            'chat.delete', channel=channel, ts=ts, as_user=as_user) or {}
+        return result_call.get('ok') or False
+
     # Real Time Messaging (RTM)
     def start_rtm(self):
         """
@@ -300,6 +397,11 @@ class Slack:
             False otherwise.
         """
         slacker = self.get_client()
+        if not slacker:
+            logging.error("no Slack client, can't connect to the Slack RTM "
+                          "stream")
+            return False
+
         logging.info("connecting to the Slack RTM stream")
 
         if slacker.rtm_connect():
@@ -0,0 +1,195 @@
+"""
+Tests of the timing wheel of the scheduler, run from the directory containing
+the freespace package:
+
+    python -m unittest freespace.tests.test_scheduler
+"""
+
+import os
+import tempfile
+import unittest
+
+from freespace import config as config_module
+from freespace import slack_client
+from freespace.config import Config
+
+# The scheduler binds the config and the Slack client when imported
+if config_module.config is None:
+    config_module.config = Config('FREESPACE')
+    config_module.config.FREESPACE.add('ENCODING', 'utf-8')
+if slack_client.slack is None:
+    slack_client.slack = slack_client.Slack()
+
+from freespace import scheduler as scheduler_module
+from freespace.scheduler import Scheduler, WHEEL_BITS, WHEEL_LEVELS
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ran = []
+        self.actions = dict(scheduler_module.actions)
+        scheduler_module.actions['send_message'] = \
+            lambda **kwargs: self.ran.append(kwargs.get('text'))
+        self.scheduler = Scheduler(1, now=0)
+
+    def tearDown(self):
+        scheduler_module.actions.clear()
+        scheduler_module.actions.update(self.actions)
+        self.scheduler.close_journal()
+
+    def run_until(self, now, scheduler=None):
+        return (scheduler or self.scheduler).run_pending(now)
+
+    def assert_fires_at(self, delay):
+        self.scheduler.schedule('send_message', delay, now=0, text=delay)
+        self.assertEqual(self.run_until(delay - 1), 0)
+        self.assertEqual(self.run_until(delay), 1)
+        self.assertEqual(self.ran, [delay])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_cascade_boundaries(self):
+        for delay in (1, 63, 64, 65, 4095, 4096, 4097, 262143, 262144,
+                      262145):
+            with self.subTest(delay=delay):
+                self.setUp()
+                self.assert_fires_at(delay)
+
+    def test_beyond_the_wheel(self):
+        # Parked in the furthest slot, then placed again when it cascades
+        span = 1 << (WHEEL_BITS * WHEEL_LEVELS)
+        for delay in (span - 1, span, span + 5, 3 * span + 7):
+            with self.subTest(delay=delay):
+                self.setUp()
+                self.assert_fires_at(delay)
+
+    def test_skipped_ticks(self):
+        # Calls far apart run everything that expired in between, in order
+        for delay in (5000, 3, 70, 300000, 64):
+            self.scheduler.schedule('send_message', delay, now=0, text=delay)
+        self.assertEqual(self.run_until(10 ** 6), 5)
+        self.assertEqual(self.ran, [3, 64, 70, 5000, 300000])
+
+    def test_delay_from_now(self):
+        self.run_until(100)
+        self.scheduler.schedule('send_message', 10, now=150, text='late')
+        self.assertEqual(self.run_until(159), 0)
+        self.assertEqual(self.run_until(160), 1)
+
+        # Already expired, runs on the next tick
+        self.scheduler.schedule('send_message', -5, now=160, text='past')
+        self.assertEqual(self.run_until(161), 1)
+
+    def test_cancel(self):
+        timer = self.scheduler.schedule('send_message', 100, now=0)
+        other = self.scheduler.schedule('send_message', 100, now=0)
+        self.assertTrue(self.scheduler.cancel(timer))
+        self.assertFalse(self.scheduler.cancel(timer))
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.run_until(200), 1)
+        self.assertFalse(self.scheduler.cancel(other))
+
+    def test_recurring(self):
+        timer = self.scheduler.schedule('send_message', 10, interval=30,
+                                        now=0, text='tick')
+        self.assertEqual(self.run_until(10), 1)
+        self.assertEqual(self.run_until(39), 0)
+        self.assertEqual(self.run_until(40), 1)
+        self.assertEqual(self.run_until(100), 2)
+        self.assertEqual(len(self.scheduler), 1)
+
+        # A late call runs the job once per interval elapsed
+        self.assertEqual(self.run_until(1000), 30)
+        self.assertEqual(self.run_until(1029), 0)
+        self.assertEqual(self.run_until(1030), 1)
+
+        self.assertTrue(self.scheduler.cancel(timer))
+        self.assertEqual(self.run_until(5000), 0)
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.schedule('unknown', 10)
+
+
+class PersistenceTestCase(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'scheduler.json')
+        self.journal_path = self.path + '.journal'
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def reload(self, tick=1):
+        scheduler = Scheduler(tick, now=0)
+        scheduler.load(self.path, self.journal_path)
+        return scheduler
+
+    def test_snapshot_round_trip(self):
+        self.scheduler.schedule('send_message', 10, now=0, text='once')
+        self.scheduler.schedule('send_message', 5000, interval=60, now=0,
+                                text='every')
+        self.scheduler.save(self.path)
+
+        scheduler = self.reload()
+        self.assertEqual(len(scheduler), 2)
+        self.assertEqual(scheduler.next_id, self.scheduler.next_id)
+        self.assertEqual(self.run_until(5000, scheduler), 2)
+        self.assertEqual(self.run_until(5060, scheduler), 1)
+        self.assertEqual(self.ran, ['once', 'every', 'every'])
+
+    def test_snapshot_with_another_tick(self):
+        self.scheduler.schedule('send_message', 100, now=0, text='once')
+        self.scheduler.save(self.path)
+
+        scheduler = self.reload(tick=10)
+        self.assertEqual(self.run_until(99, scheduler), 0)
+        self.assertEqual(self.run_until(100, scheduler), 1)
+
+    def test_journal_replay(self):
+        self.scheduler.schedule('send_message', 10, now=0, text='before')
+        self.scheduler.save(self.path)
+        self.scheduler.open_journal(self.journal_path)
+
+        fired = self.scheduler.schedule('send_message', 20, now=0)
+        cancelled = self.scheduler.schedule('send_message', 30, now=0)
+        self.scheduler.schedule('send_message', 10, interval=500, now=0,
+                                text='every')
+        self.scheduler.schedule('send_message', 1000, now=0, text='after')
+        self.scheduler.cancel(cancelled)
+        self.assertEqual(self.run_until(50), 3)
+        self.assertIsNone(fired.bucket)
+        self.scheduler.close_journal()
+
+        # Neither the fired nor the cancelled one-shot jobs come back
+        scheduler = self.reload()
+        self.assertEqual(len(scheduler), 2)
+        self.assertGreater(scheduler.next_id, cancelled.timer_id)
+        self.ran = []
+        self.assertEqual(self.run_until(509, scheduler), 0)
+        self.assertEqual(self.run_until(1000, scheduler), 2)
+        self.assertEqual(self.ran, ['every', 'after'])
+
+    def test_journal_truncated_by_save(self):
+        self.scheduler.open_journal(self.journal_path)
+        self.scheduler.schedule('send_message', 10, now=0, text='once')
+        self.scheduler.save(self.path)
+        self.assertEqual(self.scheduler.journal_entries, 1)
+
+        self.run_until(10)
+        self.scheduler.close_journal()
+        self.assertEqual(len(self.reload()), 0)
+
+    def test_corrupted_journal_line(self):
+        self.scheduler.open_journal(self.journal_path)
+        self.scheduler.schedule('send_message', 10, now=0, text='once')
+        self.scheduler.close_journal()
+        with open(self.journal_path, 'a') as journal:
+            journal.write('["remove",')
+
+        self.assertEqual(len(self.reload()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,318 @@
+"""
+Conversation state of the multi-step commands, one per thread.
+
+Contexts are kept in memory, serialized as compact JSON strings, in a table
+ordered from the least to the most recently used. The table is bounded by
+both a TTL and a maximum memory size. Threads still evicted because of the
+memory cap can be spilled to a dbm file, in a directory of its own, and loaded
+back when they get a new message. The spill file is kept open and the keys it
+holds are indexed in memory, so only the threads found in it cost a disk
+access. It is compacted once per TTL to drop the expired threads, so it only
+holds the threads spilled during the last two TTL.
+"""
+
+from collections import OrderedDict
+import dbm
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+from freespace.config import config
+
+
+# Size in bytes of the list, floats and table slot of an entry, on top of its
+# key and data strings. Measured with tracemalloc on CPython 3 while threads
+# are added and evicted, rounded up to cover the table growing and the slots
+# left by deleted keys.
+ENTRY_OVERHEAD = 256
+
+# Name of the dbm file in the spill directory
+SPILL_FILE_NAME = 'contexts'
+
+contexts = None
+
+
+class ContextStore:
+    def __init__(self, ttl, max_bytes, spill_path=None, spill_min_age=0):
+        """
+        :param ttl: Time in seconds after which a context not used is dropped.
+        :rtype ttl: float
+        :param max_bytes: Approximate maximum memory used by the contexts
+            kept in memory, the index of the spilled ones is not counted.
+        :rtype max_bytes: int
+        :param spill_path: Path of a directory to spill the contexts evicted
+            from memory to, only used by the store. Contexts are dropped when
+            not set.
+        :rtype spill_path: str
+        :param spill_min_age: Only spill contexts of threads older than this
+            many seconds, younger threads are simply dropped.
+        :rtype spill_min_age: float
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.spill_min_age = spill_min_age
+        self.size = 0
+        self.spill_path = None
+        self.last_compaction = None
+        self._entries = OrderedDict()  # key: [expires, created, data]
+        self._spilled = {}  # key: expires, of the contexts in the spill file
+        self._db = None
+        self.open_spill(spill_path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(channel, thread_ts):
+        return "{}:{}".format(channel, thread_ts)
+
+    @staticmethod
+    def _entry_size(key, entry):
+        return sys.getsizeof(key) + sys.getsizeof(entry[2]) + ENTRY_OVERHEAD
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= self._entry_size(key, entry)
+        return entry
+
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self.size += self._entry_size(key, entry)
+
+    def _evict(self, now):
+        """
+        Drop the expired contexts, then the least recently used ones until the
+        store is under its memory cap.
+        """
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[0] > now:
+                break
+            self._remove(key)
+
+        spilled = {}
+        while self._entries and self.size > self.max_bytes:
+            key, entry = next(iter(self._entries.items()))
+            self._remove(key)
+            if self.spill_path and now - entry[1] >= self.spill_min_age:
+                spilled[key] = entry
+
+        if spilled:
+            self._spill(spilled)
+
+        if self.spill_path and (self.last_compaction is None or
+                                now - self.last_compaction >= self.ttl):
+            self.compact_spill(now)
+
+    def open_spill(self, spill_path):
+        """
+        Start spilling to another directory, or stop spilling if None. The
+        contexts already in it are indexed again.
+
+        :param spill_path: Path of the directory to spill the contexts to.
+        :rtype spill_path: str
+        """
+        self.close()
+        self._spilled = {}
+        self.spill_path = spill_path
+        self.last_compaction = None
+        if spill_path:
+            self.compact_spill()
+
+    def close(self):
+        """
+        Close the spill file, it's opened again on the next spill.
+        """
+        if self._db is not None:
+            try:
+                self._db.close()
+            except Exception:
+                logging.exception("failed to close the thread contexts in {}"
+                                  .format(self.spill_path))
+            self._db = None
+
+    def _get_db(self):
+        if self._db is None:
+            os.makedirs(self.spill_path, exist_ok=True)
+            self._db = dbm.open(
+                os.path.join(self.spill_path, SPILL_FILE_NAME), 'c')
+        return self._db
+
+    def _spill(self, entries):
+        try:
+            db = self._get_db()
+            for key, entry in entries.items():
+                db[key] = json.dumps(entry, separators=(',', ':'))
+                self._spilled[key] = entry[0]
+        except Exception:
+            logging.exception("failed to spill {} thread contexts to {}"
+                              .format(len(entries), self.spill_path))
+
+    def _discard_spilled(self, key):
+        if self._spilled.pop(key, None) is None:
+            return
+
+        try:
+            db = self._get_db()
+            if key in db:
+                del db[key]
+        except Exception:
+            logging.exception("failed to delete thread context {} from {}"
+                              .format(key, self.spill_path))
+
+    def compact_spill(self, now=None):
+        """
+        Rewrite the spill file without its expired contexts. Deleting keys
+        doesn't shrink a dbm file, so the live ones are copied to a new file in
+        another directory, swapped with the spill directory. Each dbm backend
+        names its files differently, swapping the directories replaces all of
+        them without having to know their names.
+
+        :param now: Current time in seconds since the epoch, defaults to
+            time.time().
+        """
+        if now is None:
+            now = time.time()
+        self.last_compaction = now
+
+        spilled = {}
+        new_path = "{}.compact".format(self.spill_path)
+        old_path = "{}.old".format(self.spill_path)
+        try:
+            db = self._get_db()
+            # Left over by a compaction interrupted by a crash
+            for path in (new_path, old_path):
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+
+            os.mkdir(new_path)
+            with dbm.open(os.path.join(new_path, SPILL_FILE_NAME),
+                          'n') as new_db:
+                for key in db.keys():
+                    value = db[key]
+                    expires = json.loads(value)[0]
+                    if expires > now:
+                        new_db[key] = value
+                        spilled[key.decode()] = expires
+            self.close()
+
+            os.rename(self.spill_path, old_path)
+            os.rename(new_path, self.spill_path)
+            shutil.rmtree(old_path)
+        except Exception:
+            logging.exception("failed to compact the thread contexts in {}"
+                              .format(self.spill_path))
+            return
+
+        self._spilled = spilled
+
+    def _unspill(self, key, now):
+        """
+        Take a context back from the spill file.
+
+        :return: The entry if found and not expired, None otherwise.
+        """
+        expires = self._spilled.pop(key, None)
+        # Expired copies are left for the next compaction to drop
+        if expires is None or expires <= now:
+            return None
+
+        try:
+            db = self._get_db()
+            entry = json.loads(db[key])
+            del db[key]
+        except Exception:
+            logging.exception("failed to read thread context {} from {}"
+                              .format(key, self.spill_path))
+            return None
+
+        return entry
+
+    def get(self, channel, thread_ts, now=None):
+        """
+        Get the context of a thread and refresh its TTL.
+
+        :param channel: The Slack channel ID of the thread.
+        :param thread_ts: Timestamp of the parent message of the thread.
+        :param now: Current time in seconds since the epoch, defaults to
+            time.time().
+
+        :return: The context as saved with set or None if there is none.
+        """
+        if now is None:
+            now = time.time()
+        key = self._key(channel, thread_ts)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            self._remove(key)
+            entry = None
+
+        if entry is None and self.spill_path:
+            entry = self._unspill(key, now)
+            if entry is not None:
+                self._insert(key, entry)
+
+        if entry is None:
+            return None
+
+        entry[0] = now + self.ttl
+        self._entries.move_to_end(key)
+        self._evict(now)
+        return json.loads(entry[2])
+
+    def set(self, channel, thread_ts, data, now=None):
+        """
+        Save the context of a thread.
+
+        :param channel: The Slack channel ID of the thread.
+        :param thread_ts: Timestamp of the parent message of the thread.
+        :param data: Any JSON serializable value.
+        :param now: Current time in seconds since the epoch, defaults to
+            time.time().
+        """
+        if now is None:
+            now = time.time()
+        key = self._key(channel, thread_ts)
+
+        created = now
+        if key in self._entries:
+            created = self._remove(key)[1]
+        elif self.spill_path:
+            # Don't let an older spilled copy come back on the next get
+            self._discard_spilled(key)
+
+        self._insert(key, [now + self.ttl, created,
+                           json.dumps(data, separators=(',', ':'))])
+        self._evict(now)
+
+    def delete(self, channel, thread_ts):
+        """
+        Forget the context of a thread, e.g. once its command is done.
+        """
+        key = self._key(channel, thread_ts)
+        if key in self._entries:
+            self._remove(key)
+        elif self.spill_path:
+            self._discard_spilled(key)
+
+
+def start_contexts():
+    global contexts
+    contexts = ContextStore(
+        config.THREAD_CONTEXT.TTL_IN_SECONDS,
+        config.THREAD_CONTEXT.MAX_MEMORY_IN_BYTES,
+        config.THREAD_CONTEXT.SPILL_PATH if config.THREAD_CONTEXT.SPILL
+        else None,
+        config.THREAD_CONTEXT.SPILL_MIN_AGE_IN_SECONDS)
+
+
+def close_contexts():
+    """
+    Close the spill file of the global thread contexts, on shutdown.
+    """
+    if contexts:
+        contexts.close()